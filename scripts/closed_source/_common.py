@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Helpers shared by the closed-source provider scripts.
+
+Session setup, filename and cache conventions, the backoff polling loop
+and the streaming download live here so each optimization applies to
+every provider once instead of drifting per script.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Filename sanitizers, compiled once at import instead of per call
+_SAFE_RE = re.compile(r'[^a-zA-Z0-9]')
+_MODEL_RE = re.compile(r'[^a-zA-Z0-9\-]')
+
+# Persistent cache of completed generations, keyed per provider.
+# Re-running the same job during prompt iteration skips the API entirely.
+CACHE_FILE = os.path.expanduser("~/.cache/genzart/results.json")
+
+def make_session():
+    """Create a Session with keep-alive pooling and retries on gateway errors.
+
+    Reusing one session means repeated polls share a single TCP/TLS
+    connection instead of paying a fresh handshake per request.
+    """
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+    ))
+    return session
+
+def generate_unique_filename(prefix, prompt, *tags, ext=".mp4"):
+    """Generate a unique filename based on timestamp, prompt and model tags"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Create a short hash of the prompt (blake2b gives 8 hex chars directly)
+    prompt_hash = hashlib.blake2b(prompt.encode('utf-8'), digest_size=4).hexdigest()
+    # Sanitize prompt for filename (take first 20 chars and replace problematic chars)
+    safe_prompt = _SAFE_RE.sub('_', prompt[:20]).lower()
+    suffix = "_".join(tags)
+    return f"{prefix}_{timestamp}_{safe_prompt}_{prompt_hash}_{suffix}{ext}"
+
+def format_time_elapsed(seconds):
+    """Format seconds into a human-readable time string"""
+    if seconds < 60:
+        return f"{seconds:.2f} seconds"
+    elif seconds < 3600:
+        minutes = seconds / 60
+        return f"{minutes:.2f} minutes ({seconds:.2f} seconds)"
+    else:
+        hours = seconds / 3600
+        minutes = (seconds % 3600) / 60
+        return f"{hours:.2f} hours ({minutes:.2f} minutes)"
+
+def cache_load():
+    """Load the result cache, returning an empty dict if absent/corrupt"""
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def cache_store(key, output_path):
+    """Record a completed generation in the result cache"""
+    cache = cache_load()
+    cache[key] = os.path.abspath(output_path)
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    with open(CACHE_FILE, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+def download_video(session, url, output_path):
+    """Stream a video download to disk in 1MB chunks.
+
+    Keeps peak memory at one chunk instead of the full video size and
+    overlaps network reads with disk writes. A SHA-256 is computed inline
+    with the stream - OpenSSL's hardware-accelerated implementation keeps
+    up with the network, so integrity logging is effectively free.
+    """
+    digest = hashlib.sha256()
+    with session.get(url, stream=True) as response:
+        if response.status_code != 200:
+            print(f"Error downloading video: {response.status_code}")
+            return False
+        with open(output_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+                digest.update(chunk)
+    print(f"Download SHA-256: {digest.hexdigest()}")
+    return True
+
+def poll_until_done(check_status, initial_delay, cap):
+    """Drive a polling loop with exponential backoff and jitter.
+
+    check_status(attempt) issues one status request and classifies it as:
+      ("done", result)    - terminal success; result handed back to caller
+      ("failed", info)    - terminal failure
+      ("timeout", None)   - long-poll read timeout; reissue immediately
+      ("pending", status) - still running; backoff resets when status
+                            changes, but a status of None (transient
+                            error, state unknown) never resets it
+
+    The first check runs immediately; afterwards the delay grows by 1.5x
+    per attempt up to cap, with small random jitter. Returns the terminal
+    ("done"/"failed", payload) pair.
+    """
+    delay = initial_delay
+    last_status = None
+    skip_sleep = True
+    attempt = 0
+    while True:
+        if skip_sleep:
+            skip_sleep = False
+        else:
+            time.sleep(delay + random.uniform(0, 0.5))
+            delay = min(cap, delay * 1.5)
+        attempt += 1
+        state, payload = check_status(attempt)
+        if state in ("done", "failed"):
+            return state, payload
+        if state == "timeout":
+            # The request was already held open for its full read timeout,
+            # so reissue immediately rather than sleeping on top of it
+            skip_sleep = True
+        elif payload is not None and payload != last_status:
+            # Reset the backoff on real state transitions so the next state
+            # is sampled quickly again. Error polls report None and must
+            # keep backing off, or an outage gets hammered at the minimum
+            # interval
+            delay = initial_delay
+            last_status = payload
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+Dispatch a batch of video generation jobs across providers concurrently.
+
+Each job in the JSON jobs file selects a provider and its parameters:
+
+    [
+      {"provider": "minimax", "image": "inputs/cats_on_table.jpg",
+       "prompt": "Two cats at a dining table.", "model": "I2V-01-Director"},
+      {"provider": "kling", "image_url": "https://i.imgur.com/mbvOZ38.jpeg",
+       "prompt": "A focused man studying.", "model": "2.0", "mode": "std",
+       "duration": 5}
+    ]
+
+Since virtually all wall time is spent waiting on the vendor APIs, the
+jobs share one event loop and one HTTP client, so a batch finishes in
+roughly the time of its slowest job instead of the sum of all of them.
+MiniMax jobs additionally share a single polling cycle: every wakeup
+checks all in-flight tasks at once instead of one task per timer.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+import dotenv
+import httpx
+import orjson
+
+# Sibling modules in this directory; reuse the shared helpers and each
+# script's cache-key convention so batch results land in the same places
+# as single runs
+import _common
+import minMax_hailuo as hailuo
+import piapi_kling as kling
+
+# Load environment variables from .env file
+dotenv.load_dotenv()
+
+MINIMAX_BASE = "https://api.minimaxi.chat/v1"
+PIAPI_BASE = "https://api.piapi.ai/api/v1"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a batch of video generation jobs concurrently")
+    parser.add_argument("--jobs", type=str, required=True, help="Path to JSON file listing jobs")
+    parser.add_argument("--output_dir", type=str, default="outputs", help="Directory to save output videos")
+    parser.add_argument("--poll_interval", type=int, default=10, help="Base polling interval in seconds (default: 10)")
+    return parser.parse_args()
+
+async def download_video(client, url, output_path):
+    """Stream a video download to disk in 1MB chunks.
+
+    A SHA-256 is computed inline with the stream; the hardware-accelerated
+    hash keeps up with the network, so integrity logging is effectively free.
+    """
+    digest = hashlib.sha256()
+    async with client.stream("GET", url) as response:
+        if response.status_code != 200:
+            print(f"Error downloading video: {response.status_code}")
+            return False
+        with open(output_path, "wb") as f:
+            async for chunk in response.aiter_bytes(1024 * 1024):
+                f.write(chunk)
+                digest.update(chunk)
+    print(f"Download SHA-256: {digest.hexdigest()}")
+    return True
+
+async def minimax_submit(client, job, headers):
+    """Submit one MiniMax job and return its task_id"""
+    model = job.get("model", "I2V-01-Director")
+
+    # Encode off the event loop so a large image does not stall other jobs
+    data = await asyncio.to_thread(hailuo.encode_image, job["image"])
+
+    # Serialize with orjson straight to bytes: aiohttp's json= would build
+    # the multi-MB body as a str first and re-encode it. Neither vendor
+    # accepts multipart uploads (MiniMax wants base64-in-JSON, Kling takes
+    # a URL), so this is as close to zero-copy as the submit path gets.
+    payload = orjson.dumps({
+        "model": model,
+        "prompt": job["prompt"],
+        "first_frame_image": f"data:image/jpeg;base64,{data}",
+    })
+    response = await client.post(f"{MINIMAX_BASE}/video_generation",
+                                 content=payload,
+                                 headers={**headers, "Content-Type": "application/json"})
+    if response.status_code != 200:
+        raise RuntimeError(f"minimax submit failed: {response.status_code} {response.text}")
+    task_id = response.json().get("task_id")
+    if not task_id:
+        raise RuntimeError("minimax submit returned no task_id")
+    return task_id
+
+async def query_video_generation_batch(client, task_ids, headers):
+    """Poll the status of many MiniMax tasks in one cycle.
+
+    MiniMax has no documented multi-task status endpoint, so the batch is
+    coalesced client-side: one GET per task, but all issued concurrently
+    on the shared client within a single wakeup. Returns a dict of
+    task_id -> (file_id, status); a transient failure - non-200 response,
+    transport error, read timeout or undecodable body - yields a status
+    of None so the task simply stays in flight.
+    """
+    async def query_one(task_id):
+        try:
+            response = await client.get(f"{MINIMAX_BASE}/query/video_generation?task_id={task_id}",
+                                        headers=headers)
+            if response.status_code != 200:
+                return task_id, (None, None)
+            status_data = response.json()
+        except (httpx.HTTPError, ValueError):
+            # One flaky poll must not kill a multi-minute batch; the next
+            # cycle retries this task
+            return task_id, (None, None)
+        return task_id, (status_data.get("file_id", ""), status_data.get("status", ""))
+
+    return dict(await asyncio.gather(*(query_one(t) for t in task_ids)))
+
+async def minimax_download(client, file_id, job, output_dir, cache_key, headers):
+    """Retrieve the download URL for a finished task and save the video"""
+    response = await client.get(f"{MINIMAX_BASE}/files/retrieve?file_id={file_id}",
+                                headers=headers)
+    download_url = response.json().get("file", {}).get("download_url", "")
+    if not download_url:
+        raise RuntimeError("minimax: no download URL")
+
+    model = job.get("model", "I2V-01-Director")
+    safe_model = _common._MODEL_RE.sub('_', model).lower()
+    out_dir = os.path.join(output_dir, "minMax", safe_model)
+    os.makedirs(out_dir, exist_ok=True)
+    output_path = os.path.join(out_dir, _common.generate_unique_filename("minimax", job["prompt"], safe_model))
+    if not await download_video(client, download_url, output_path):
+        raise RuntimeError("minimax: download failed")
+    _common.cache_store(cache_key, output_path)
+    print(f"[minimax] video saved to {output_path}")
+    return output_path
+
+async def minimax_run_batch(client, jobs, output_dir, poll_interval):
+    """Run all MiniMax jobs with one shared polling cycle.
+
+    Submissions and downloads run concurrently per job, but status checks
+    are driven by a single backoff timer covering every in-flight task.
+    Returns one result (output path or exception) per job, in order.
+    """
+    api_key = os.environ.get("MINIMAX_API_KEY")
+    if not api_key:
+        error = RuntimeError("MINIMAX_API_KEY not set")
+        return [error] * len(jobs)
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    results = {}
+    pending = {}  # task_id -> (job index, cache_key)
+
+    async def submit_one(index, job):
+        # Everything per-job stays inside the try, so a bad image path or a
+        # malformed job dict fails that job alone instead of crashing the
+        # whole gather
+        try:
+            cache_key = hailuo.compute_cache_key(
+                job["image"], job["prompt"], job.get("model", "I2V-01-Director"))
+            cached_path = _common.cache_load().get(cache_key)
+            if cached_path and os.path.isfile(cached_path):
+                print(f"[minimax] cache hit: {cached_path}")
+                results[index] = cached_path
+                return
+            task_id = await minimax_submit(client, job, headers)
+            print(f"[minimax] task submitted: {task_id}")
+            pending[task_id] = (index, cache_key)
+        except Exception as exc:
+            results[index] = exc
+
+    await asyncio.gather(*(submit_one(i, job) for i, job in enumerate(jobs)))
+
+    async def finish_one(index, cache_key, file_id):
+        try:
+            results[index] = await minimax_download(
+                client, file_id, jobs[index], output_dir, cache_key, headers)
+        except Exception as exc:
+            results[index] = exc
+
+    delay = poll_interval / 5
+    cap = poll_interval * 4
+    downloads = []
+    while pending:
+        await asyncio.sleep(delay + random.uniform(0, 0.5))
+        delay = min(cap, delay * 1.5)
+        statuses = await query_video_generation_batch(client, list(pending), headers)
+        for task_id, (file_id, status) in statuses.items():
+            if status == "Success" and file_id:
+                index, cache_key = pending.pop(task_id)
+                downloads.append(asyncio.ensure_future(finish_one(index, cache_key, file_id)))
+            elif status in ("Fail", "Error", "Unknown"):
+                index, _ = pending.pop(task_id)
+                results[index] = RuntimeError(f"minimax task {task_id} failed with status {status}")
+            # None (transient HTTP error) or a pending status: stay in flight
+
+    if downloads:
+        await asyncio.gather(*downloads)
+    return [results[i] for i in range(len(jobs))]
+
+async def kling_submit_and_wait(client, job, output_dir, poll_interval):
+    """Submit one PiAPI Kling job and poll it to completion.
+
+    PiAPI also lacks a batch status endpoint; concurrent Kling jobs still
+    share the one client and event loop, so their polls interleave.
+    """
+    api_key = os.environ.get("PIAPI_KEY")
+    if not api_key:
+        raise RuntimeError("PIAPI_KEY not set")
+
+    prompt = job["prompt"]
+    image_url = job["image_url"]
+    model = job.get("model", "2.0")
+    mode = job.get("mode", "std")
+    headers = {"x-api-key": api_key}
+
+    args = argparse.Namespace(
+        prompt=prompt,
+        negative_prompt=job.get("negative_prompt", ""),
+        model=model,
+        mode=mode,
+        duration=job.get("duration", 5),
+        aspect_ratio=job.get("aspect_ratio", "16:9"),
+    )
+    cache_key = kling.compute_cache_key(image_url, args)
+    cached_path = _common.cache_load().get(cache_key)
+    if cached_path and os.path.isfile(cached_path):
+        print(f"[kling] cache hit: {cached_path}")
+        return cached_path
+
+    payload = {
+        "model": "kling",
+        "task_type": "video_generation",
+        "input": {
+            "prompt": prompt,
+            "negative_prompt": args.negative_prompt,
+            "cfg_scale": 0.5,
+            "duration": args.duration,
+            "aspect_ratio": args.aspect_ratio,
+            "mode": mode,
+            "version": model,
+            "image_url": image_url,
+        },
+    }
+    response = await client.post(f"{PIAPI_BASE}/task", json=payload, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"kling submit failed: {response.status_code} {response.text}")
+    response_data = response.json()
+    if response_data.get("code") != 200:
+        raise RuntimeError(f"kling submit error: {response_data.get('message')}")
+    task_id = response_data.get("data", {}).get("task_id")
+    if not task_id:
+        raise RuntimeError("kling submit returned no task_id")
+    print(f"[kling] task submitted: {task_id}")
+
+    status_url = f"{PIAPI_BASE}/task/{task_id}"
+    # Same backoff schedule as the MiniMax path, derived from --poll_interval
+    delay = poll_interval / 5
+    cap = poll_interval * 4
+    while True:
+        await asyncio.sleep(delay + random.uniform(0, 0.5))
+        delay = min(cap, delay * 1.5)
+        response = await client.get(status_url, headers=headers)
+        if response.status_code != 200:
+            continue
+        status_data = response.json()
+        if status_data.get("code") != 200:
+            continue
+        task_status = status_data.get("data", {}).get("status", "").lower()
+        if task_status == "completed":
+            break
+        if task_status == "failed":
+            error = status_data.get("data", {}).get("error", {})
+            raise RuntimeError(f"kling task {task_id} failed: {error.get('message', 'unknown')}")
+
+    video_url = status_data.get("data", {}).get("output", {}).get("video_url")
+    if not video_url:
+        raise RuntimeError(f"kling task {task_id}: no video URL")
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, _common.generate_unique_filename("kling", prompt, model, mode))
+    if not await download_video(client, video_url, output_path):
+        raise RuntimeError(f"kling task {task_id}: download failed")
+    _common.cache_store(cache_key, output_path)
+    print(f"[kling] video saved to {output_path}")
+    return output_path
+
+async def run_jobs(jobs, output_dir, poll_interval):
+    """Run all jobs concurrently on one client and report per-job results"""
+    results = [None] * len(jobs)
+
+    minimax_indices = [i for i, job in enumerate(jobs) if job.get("provider") == "minimax"]
+    kling_indices = [i for i, job in enumerate(jobs) if job.get("provider") == "kling"]
+    for i, job in enumerate(jobs):
+        if i not in minimax_indices and i not in kling_indices:
+            results[i] = ValueError(f"Unknown provider '{job.get('provider')}' in job: {job}")
+
+    # HTTP/2 multiplexes every concurrent poll and download over a single
+    # connection per host, so N in-flight jobs no longer mean N sockets
+    # and N TLS handshakes
+    limits = httpx.Limits(max_connections=32, max_keepalive_connections=8)
+    timeout = httpx.Timeout(30.0, read=60.0)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=timeout) as client:
+
+        async def run_minimax():
+            batch = await minimax_run_batch(
+                client, [jobs[i] for i in minimax_indices], output_dir, poll_interval)
+            for i, result in zip(minimax_indices, batch):
+                results[i] = result
+
+        async def run_kling(index):
+            try:
+                results[index] = await kling_submit_and_wait(
+                    client, jobs[index], output_dir, poll_interval)
+            except Exception as exc:
+                results[index] = exc
+
+        coros = [run_kling(i) for i in kling_indices]
+        if minimax_indices:
+            coros.append(run_minimax())
+        await asyncio.gather(*coros)
+
+    return results
+
+def main():
+    args = parse_args()
+
+    with open(args.jobs) as f:
+        jobs = json.load(f)
+    if not jobs:
+        print("No jobs found in jobs file")
+        return
+
+    print(f"Running {len(jobs)} jobs concurrently...")
+    start_time = time.time()
+    results = asyncio.run(run_jobs(jobs, args.output_dir, args.poll_interval))
+
+    succeeded = 0
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            print(f"FAILED  {job.get('provider')}: {result}")
+        else:
+            print(f"OK      {job.get('provider')}: {result}")
+            succeeded += 1
+    print(f"{succeeded}/{len(jobs)} jobs succeeded in {_common.format_time_elapsed(time.time() - start_time)}")
+
+if __name__ == "__main__":
+    main()
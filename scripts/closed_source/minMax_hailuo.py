@@ -5,18 +5,27 @@ Script to generate videos from images using MiniMax Hailuo API
 
 import requests
 import json
+import orjson
 import base64
+import mmap
 import argparse
+import hashlib
 import os
-import datetime
 import dotenv
-import uuid
-import re
+import functools
+import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import _common
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
 
+# Shared session: keep-alive + connection pooling means repeated polls reuse
+# one TCP/TLS connection instead of paying a fresh handshake per request
+SESSION = _common.make_session()
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Generate video from image using MiniMax Hailuo API")
     parser.add_argument("--image", type=str, required=True, help="Path to input image")
@@ -27,114 +36,148 @@ def parse_args():
     parser.add_argument("--poll_interval", type=int, default=10, help="Polling interval in seconds (default: 10)")
     return parser.parse_args()
 
-def generate_unique_filename(prompt, model, ext=".mp4"):
-    """Generate a unique filename based on timestamp, prompt and model"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    # Create a short hash of the prompt
-    prompt_hash = str(uuid.uuid5(uuid.NAMESPACE_DNS, prompt))[:8]
-    # Sanitize prompt for filename (take first 20 chars and replace problematic chars)
-    safe_prompt = re.sub(r'[^a-zA-Z0-9]', '_', prompt[:20]).lower()
-    # Sanitize model name for directory
-    safe_model = re.sub(r'[^a-zA-Z0-9\-]', '_', model).lower()
-    
-    return f"minimax_{timestamp}_{safe_prompt}_{prompt_hash}_{safe_model}{ext}"
-
-def format_time_elapsed(seconds):
-    """Format seconds into a human-readable time string"""
-    if seconds < 60:
-        return f"{seconds:.2f} seconds"
-    elif seconds < 3600:
-        minutes = seconds / 60
-        return f"{minutes:.2f} minutes ({seconds:.2f} seconds)"
-    else:
-        hours = seconds / 3600
-        minutes = (seconds % 3600) / 60
-        return f"{hours:.2f} hours ({minutes:.2f} minutes)"
+def compute_cache_key(image_path, prompt, model):
+    """Hash the image bytes plus generation parameters into a cache key"""
+    h = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        h.update(f.read())
+    h.update(prompt.encode('utf-8'))
+    h.update(model.encode('utf-8'))
+    return f"minimax:{h.hexdigest()}"
+
+def encode_image(image_path):
+    """Base64-encode an image for the data URI payload.
 
-def query_video_generation(api_key, task_id):
-    """Query the status of a video generation task"""
+    The API only accepts a base64 data URI in the JSON body (no multipart
+    upload), so base64 is unavoidable - but encoding a memory-mapped view
+    lets the C encoder read straight from the page cache without an
+    intermediate read() copy of the whole file.
+    """
+    with open(image_path, "rb") as image_file:
+        with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode('ascii')
+
+def make_status_poller(task_id, api_headers, timeout=60):
+    """Bind the status URL, auth headers and timeout once for the polling
+    hot path.
+
+    Every iteration then makes a single pooled-session call with no
+    per-poll string formatting or dict allocation.
+    """
     url = f"https://api.minimaxi.chat/v1/query/video_generation?task_id={task_id}"
-    headers = {
-        'Authorization': f'Bearer {api_key}'
-    }
-    
-    response = requests.get(url, headers=headers)
+    return functools.partial(SESSION.get, url, headers=api_headers, timeout=timeout)
+
+def query_video_generation(poll):
+    """Query the status of a video generation task via a bound poller.
+
+    MiniMax has no server-side wait/long-poll parameter, so we approximate
+    long-polling client-side: hold the connection open with a long read
+    timeout and report "Timeout" so the caller can reissue immediately
+    instead of sleeping.
+    """
+    try:
+        response = poll()
+    except requests.exceptions.Timeout:
+        return None, "Timeout"
     if response.status_code != 200:
         print(f"Error querying task status: {response.status_code}")
         print(f"Response: {response.text}")
         return None, "Error"
-    
+
     response_data = response.json()
     status = response_data.get('status', '')
-    
+
     if status == 'Success':
         file_id = response_data.get('file_id', '')
         return file_id, "Success"
     else:
         return None, status
 
-def fetch_video_result(api_key, file_id, output_path):
-    """Fetch the generated video using the file_id"""
+def fetch_video_result(file_id, output_path, api_headers):
+    """Fetch the generated video using the file_id.
+
+    Auth goes only on the API call; the download URL points at the
+    vendor's storage host, which must not see the API key.
+    """
     print("Retrieving video download URL...")
     url = f"https://api.minimaxi.chat/v1/files/retrieve?file_id={file_id}"
-    headers = {
-        'Authorization': f'Bearer {api_key}'
-    }
-    
-    response = requests.get(url, headers=headers)
+
+    response = SESSION.get(url, headers=api_headers)
     if response.status_code != 200:
         print(f"Error retrieving file: {response.status_code}")
         print(f"Response: {response.text}")
         return False
-    
+
     response_data = response.json()
     download_url = response_data.get('file', {}).get('download_url', '')
-    
+
     if not download_url:
         print("Error: No download URL found in response")
         print(f"Response: {json.dumps(response_data, indent=2)}")
         return False
-    
+
     print(f"Video download URL: {download_url}")
     print("Downloading video...")
-    
+
     download_start = time.time()
-    video_response = requests.get(download_url)
-    if video_response.status_code != 200:
-        print(f"Error downloading video: {video_response.status_code}")
+    if not _common.download_video(SESSION, download_url, output_path):
         return False
-    
-    with open(output_path, 'wb') as f:
-        f.write(video_response.content)
-    
+
     download_duration = time.time() - download_start
-    print(f"Video downloaded in {format_time_elapsed(download_duration)}")
+    print(f"Video downloaded in {_common.format_time_elapsed(download_duration)}")
     return True
 
 def main():
     args = parse_args()
-    
+
     # Start timing
     start_time = time.time()
-    
+
     # Get API key from arguments or environment
     api_key = args.api_key or os.environ.get("MINIMAX_API_KEY")
     if not api_key:
         print("Error: MiniMax API key not provided. Use --api_key or set MINIMAX_API_KEY environment variable.")
         return
-    
+
+    # Auth headers go only on API calls, never on the session defaults:
+    # the video download URL points at the vendor's storage host, which
+    # must not see the API key
+    api_headers = {'Authorization': f'Bearer {api_key}'}
+
     # Validate image path
     if not os.path.isfile(args.image):
         print(f"Error: Input image '{args.image}' does not exist")
         return
 
-    # Encode the image
+    # Check the persistent cache before touching the API
+    cache_key = compute_cache_key(args.image, args.prompt, args.model)
+    cached_path = _common.cache_load().get(cache_key)
+    if cached_path and os.path.isfile(cached_path):
+        print(f"Cache hit: reusing previously generated video {cached_path}")
+        if args.output and os.path.abspath(args.output) != cached_path:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            shutil.copyfile(cached_path, args.output)
+            print(f"Video copied to {args.output}")
+        return
+
+    # Encode the image in a worker thread while pre-warming the DNS/TCP/TLS
+    # connection to the API host; the pooled connection is then reused by
+    # the submit POST, hiding the handshake behind the encoding work
     print(f"Encoding image: {args.image}")
     encoding_start = time.time()
-    with open(args.image, "rb") as image_file:
-        data = base64.b64encode(image_file.read()).decode('utf-8')
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        encode_future = executor.submit(encode_image, args.image)
+        warm_future = executor.submit(
+            SESSION.head, "https://api.minimaxi.chat/v1/video_generation",
+            headers=api_headers, timeout=10)
+        data = encode_future.result()
+        try:
+            warm_future.result().close()
+        except requests.RequestException:
+            # Warming is best-effort; the submit POST reports real errors
+            pass
     print(f"Image encoded in {time.time() - encoding_start:.2f} seconds")
-    
+
     # Determine output path
     if args.output:
         # Use specified output path
@@ -143,13 +186,13 @@ def main():
         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
     else:
         # Generate unique filename in a model-specific subfolder
-        safe_model = re.sub(r'[^a-zA-Z0-9\-]', '_', args.model).lower()
+        safe_model = _common._MODEL_RE.sub('_', args.model).lower()
         output_dir = os.path.join("outputs", "minMax", safe_model)
         os.makedirs(output_dir, exist_ok=True)
-        
-        filename = generate_unique_filename(args.prompt, args.model)
+
+        filename = _common.generate_unique_filename("minimax", args.prompt, safe_model)
         output_path = os.path.join(output_dir, filename)
-    
+
     # Print configuration
     print(f"Configuration:")
     print(f"Image: {args.image}")
@@ -157,86 +200,98 @@ def main():
     print(f"Model: {args.model}")
     print(f"Output will be saved to: {output_path}")
     print(f"Poll interval: {args.poll_interval} seconds")
-    
+
     # Prepare API request
     url = "https://api.minimaxi.chat/v1/video_generation"
-    
-    payload = json.dumps({
+
+    # orjson serializes straight to bytes in C - for the multi-MB base64 body
+    # this skips json.dumps' str intermediary and its re-encode to bytes
+    payload = orjson.dumps({
         "model": args.model,
         "prompt": args.prompt,
         "first_frame_image": f"data:image/jpeg;base64,{data}"
     })
-    
+
     headers = {
-        'Authorization': f'Bearer {api_key}',
+        **api_headers,
         'Content-Type': 'application/json'
     }
-    
+
     # Submit the video generation task
     print(f"Submitting video generation task to MiniMax API...")
     api_request_start = time.time()
-    response = requests.post(url, headers=headers, data=payload)
+    response = SESSION.post(url, headers=headers, data=payload)
     api_request_duration = time.time() - api_request_start
-    
+
     if response.status_code != 200:
         print(f"Error: API request failed with status code {response.status_code}")
         print(f"Response: {response.text}")
         return
-    
+
     print(f"API request completed in {api_request_duration:.2f} seconds")
-    
+
     try:
         response_data = response.json()
     except json.JSONDecodeError:
         print(f"Error: Failed to parse API response as JSON")
         print(f"Response: {response.text}")
         return
-    
+
     # Get task ID for tracking
     task_id = response_data.get('task_id')
     if not task_id:
         print("Error: No task_id in API response")
         print(f"Response: {json.dumps(response_data, indent=2)}")
         return
-    
+
     print(f"Video generation task submitted successfully. Task ID: {task_id}")
-    
+
     # Poll for task completion
     generation_start = time.time()
     poll_count = 0
-    
-    while True:
-        poll_count += 1
-        print(f"Polling for task status... (Attempt #{poll_count})")
-        
-        file_id, status = query_video_generation(api_key, task_id)
-        
+    poll = make_status_poller(task_id, api_headers)
+
+    def check_status(attempt):
+        nonlocal poll_count
+        poll_count = attempt
+        print(f"Polling for task status... (Attempt #{attempt})")
+
+        file_id, status = query_video_generation(poll)
+
         elapsed = time.time() - generation_start
-        print(f"Status: {status} - Time elapsed: {format_time_elapsed(elapsed)}")
-        
+        print(f"Status: {status} - Time elapsed: {_common.format_time_elapsed(elapsed)}")
+
         if status == "Success" and file_id:
-            generation_duration = time.time() - generation_start
-            print(f"Video generation completed in {format_time_elapsed(generation_duration)}!")
-            
-            # Fetch and save the video
-            if fetch_video_result(api_key, file_id, output_path):
-                total_duration = time.time() - start_time
-                print(f"Video saved to {output_path}")
-                print(f"Total process completed in {format_time_elapsed(total_duration)}")
-                print(f"Video generation statistics:")
-                print(f"  - API request time: {api_request_duration:.2f} seconds")
-                print(f"  - Generation time: {generation_duration:.2f} seconds")
-                print(f"  - Polling attempts: {poll_count}")
-                print(f"  - Average time per poll: {generation_duration/poll_count:.2f} seconds")
-            break
-        elif status in ["Fail", "Error", "Unknown"]:
-            generation_duration = time.time() - generation_start
-            print(f"Generation failed after {format_time_elapsed(generation_duration)}")
-            print(f"Total time elapsed: {format_time_elapsed(time.time() - start_time)}")
-            return
-        else:
-            # Status is one of: "Preparing", "Queueing", "Processing"
-            time.sleep(args.poll_interval)
+            return "done", file_id
+        if status == "Timeout":
+            return "timeout", None
+        if status in ["Fail", "Error", "Unknown"]:
+            return "failed", status
+        # Status is one of: "Preparing", "Queueing", "Processing"
+        return "pending", status
+
+    state, result = _common.poll_until_done(
+        check_status, args.poll_interval / 5, args.poll_interval * 4)
+
+    generation_duration = time.time() - generation_start
+    if state == "failed":
+        print(f"Generation failed after {_common.format_time_elapsed(generation_duration)}")
+        print(f"Total time elapsed: {_common.format_time_elapsed(time.time() - start_time)}")
+        return
+
+    print(f"Video generation completed in {_common.format_time_elapsed(generation_duration)}!")
+
+    # Fetch and save the video
+    if fetch_video_result(result, output_path, api_headers):
+        _common.cache_store(cache_key, output_path)
+        total_duration = time.time() - start_time
+        print(f"Video saved to {output_path}")
+        print(f"Total process completed in {_common.format_time_elapsed(total_duration)}")
+        print(f"Video generation statistics:")
+        print(f"  - API request time: {api_request_duration:.2f} seconds")
+        print(f"  - Generation time: {generation_duration:.2f} seconds")
+        print(f"  - Polling attempts: {poll_count}")
+        print(f"  - Average time per poll: {generation_duration/poll_count:.2f} seconds")
 
 if __name__ == "__main__":
     main()